@@ -1,18 +1,221 @@
 # backend/rl_agent/blockchain.py
 import os
-from web3 import Web3
-from web3.middleware import geth_poa_middleware # For PoA networks like LUKSO Testnet
+import time
+import asyncio
+import functools
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from web3 import Web3, AsyncWeb3, AsyncHTTPProvider
+from web3.middleware import async_geth_poa_middleware # For PoA networks like LUKSO Testnet
+from web3.exceptions import TransactionNotFound
 from dotenv import load_dotenv
+from eth_utils import function_abi_to_4byte_selector, function_signature_to_4byte_selector
+import eth_abi
 import json
 
-# ABIs (simplified, load full ABIs from files in a real app)
-UP_ABI = json.loads('[{"inputs":[{"internalType":"bytes[]","name":"data","type":"bytes[]"}],"name":"setDataBatch","outputs":[],"stateMutability":"payable","type":"function"}, {"inputs":[{"internalType":"address","name":"","type":"address"}],"name":"getData","outputs":["bytes"],"stateMutability":"view","type":"function"}, {"inputs":[],"name":"owner","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"}]') # Add more as needed
-LSP7_ABI = json.loads('[{"inputs":[{"internalType":"address","name":"from","type":"address"},{"internalType":"address","name":"to","type":"address"},{"internalType":"uint256","name":"amount","type":"uint256"},{"internalType":"bool","name":"force","type":"bool"},{"internalType":"bytes","name":"data","type":"bytes"}],"name":"transfer","outputs":[],"stateMutability":"nonpayable","type":"function"}]') # Add more
-LSP6_KEY_MANAGER_ABI = json.loads('[{"inputs":[{"internalType":"address","name":"_address","type":"address"},{"internalType":"bytes4","name":"_functionSelector","type":"bytes4"},{"internalType":"bytes","name":"_data","type":"bytes"}],"name":"executeRelayCall","outputs":["bytes"],"stateMutability":"payable","type":"function"}, {"inputs":[{"internalType":"bytes[]","name":"keys","type":"bytes[]"},{"internalType":"bytes[]","name":"values","type":"bytes[]"}],"name":"setDataBatch","outputs":[],"stateMutability":"payable","type":"function"}]') # Add more as needed
+try:
+    import redis.asyncio as aioredis # Optional: only needed to share the nonce counter between uvicorn workers
+except ImportError:
+    aioredis = None
 
+ABI_DIR = os.path.join(os.path.dirname(__file__), "abis")
+
+@functools.lru_cache(maxsize=None)
+def _load_abi(name: str):
+    # ABIs are simplified subsets of the LUKSO contracts; add entries to the JSON files as needed
+    with open(os.path.join(ABI_DIR, f"{name}.json")) as f:
+        return json.load(f)
+
+UP_ABI = _load_abi("UniversalProfile")
+LSP7_ABI = _load_abi("LSP7DigitalAsset")
+LSP6_KEY_MANAGER_ABI = _load_abi("LSP6KeyManager")
+
+# 4-byte selector -> ABI entry for every function we know about, e.g. to decode outgoing calldata
+_FN_BY_SELECTOR = {
+    function_abi_to_4byte_selector(entry): entry
+    for abi in (UP_ABI, LSP7_ABI, LSP6_KEY_MANAGER_ABI)
+    for entry in abi if entry["type"] == "function"
+}
+
+_TRANSFER_SELECTOR = function_signature_to_4byte_selector("transfer(address,address,uint256,bool,bytes)")
+_TRANSFER_ARG_TYPES = ["address", "address", "uint256", "bool", "bytes"]
+
+def encode_lsp7_transfer(sender: str, to: str, amount: int, force: bool = True, data: bytes = b"") -> str:
+    """Calldata for LSP7 `transfer`, encoded directly with eth_abi instead of going through Contract.encodeABI."""
+    return Web3.to_hex(_TRANSFER_SELECTOR + eth_abi.encode(_TRANSFER_ARG_TYPES, (sender, to, amount, force, data)))
+
+# Node error messages that mean our cached nonce is out of sync with the chain
+NONCE_ERROR_MESSAGES = ("nonce too low", "nonce too high", "already known", "known transaction")
+# Base fee only changes once per block, so fee data is reused for roughly one block time
+FEE_CACHE_TTL_SECONDS = 2.0
+GAS_ESTIMATE_PADDING = 1.2 # Headroom on cached per-function gas estimates
+# Cached estimates go stale as contract state changes (e.g. new data keys written), so re-estimate periodically
+GAS_ESTIMATE_TTL_SECONDS = 300.0
+# LSP7 transfer gas depends on the recipient (universalReceiver hook, LSP5 writes, zero-to-nonzero balance slot),
+# so a cached estimate from one recipient can run out of gas for another: estimate every transfer
+_UNCACHED_GAS_SELECTORS = {Web3.to_hex(_TRANSFER_SELECTOR)}
+RPC_CONNECTION_POOL_SIZE = 100 # Keep-alive sockets shared by all concurrent requests to the RPC
+SIGNING_THREADS = 4 # coincurve releases the GIL while signing, so threads are enough
+# RPC methods whose result never changes for given params within a session
+IMMUTABLE_RPC_METHODS = {"eth_chainId", "eth_getCode"}
+# UP owner (the KeyManager) practically never changes, but keep the cache short-lived in case it is upgraded
+UP_OWNER_CACHE_TTL_SECONDS = 300.0
+MAX_TRACKED_RECEIPTS = 1024 # Finished receipt waits beyond this are dropped if nobody polled them
+# LUKSO produces a block every ~12 s, so polling for receipts more often than this only burns RPC calls
+RECEIPT_POLL_LATENCY_SECONDS = 4.0
+# Data writes to the same UP queued within this window are sent as a single setDataBatch tx
+SET_DATA_BATCH_WINDOW_SECONDS = 0.2
 
 load_dotenv()
 
+def _is_nonce_error(e: Exception) -> bool:
+    return any(msg in str(e).lower() for msg in NONCE_ERROR_MESSAGES)
+
+def _log_receipt_failure(task: asyncio.Task):
+    # Retrieves the exception of a receipt wait that may never be polled, so asyncio doesn't warn
+    # "Task exception was never retrieved"; a later poll falls back to a direct lookup anyway
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Waiting for a transaction receipt failed: {task.exception()!r}")
+
+@functools.lru_cache(maxsize=4096)
+def _cksum(address: str) -> str:
+    return Web3.to_checksum_address(address)
+
+async def immutable_rpc_cache_middleware(make_request, w3):
+    """Caches successful responses to IMMUTABLE_RPC_METHODS keyed on (method, params)."""
+    cache = {}
+
+    async def middleware(method, params):
+        if method not in IMMUTABLE_RPC_METHODS:
+            return await make_request(method, params)
+        key = (method, tuple(params))
+        if key not in cache:
+            response = await make_request(method, params)
+            if "error" in response:
+                return response
+            cache[key] = response
+        return cache[key]
+    return middleware
+
+# Redis scripts for the shared counter. KEYS[1] holds the last nonce handed out, KEYS[2] is a sorted set of
+# released nonces that must be reused before the counter advances (a skipped nonce blocks every later tx).
+_NEXT_NONCE_SCRIPT = """
+local released = redis.call('ZPOPMIN', KEYS[2])
+if released[1] then
+    return tonumber(released[1])
+end
+return redis.call('INCR', KEYS[1])
+"""
+_RELEASE_NONCE_SCRIPT = """
+local last = tonumber(redis.call('GET', KEYS[1]))
+if last and tonumber(ARGV[1]) <= last then
+    redis.call('ZADD', KEYS[2], ARGV[1], ARGV[1])
+end
+return 1
+"""
+# Seeds the counter from the pending count (ARGV[1]): never moves it backwards, since other workers may hold
+# nonces that aren't broadcast yet, but catches up with txs sent elsewhere and drops released nonces below it
+_SEED_NONCE_SCRIPT = """
+local last = tonumber(redis.call('GET', KEYS[1]))
+local pending = tonumber(ARGV[1])
+if not last or last < pending - 1 then
+    redis.call('SET', KEYS[1], pending - 1)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', pending - 1)
+return 1
+"""
+
+class NonceManager:
+    """
+    Hands out nonces for the agent EOA. With a Redis URL the counter lives in Redis (INCR on
+    "nonce:<address>"), so every uvicorn worker draws from the same sequence; otherwise it is a
+    process-local counter, which is only safe with a single worker.
+    Nonces of sends the node rejected are released and handed out again before any new one, so they
+    never leave a gap. Nonces whose send failed in transit are unknown until the next pending count.
+    """
+
+    def __init__(self, address: str, redis_url: str = None, redis=None):
+        self.key = f"nonce:{address}"
+        self.free_key = f"nonce:{address}:free"
+        self._lock = asyncio.Lock()
+        self._redis = redis
+        if redis is None and redis_url:
+            if aioredis is None:
+                raise ValueError("REDIS_URL is set but the redis package is not installed")
+            self._redis = aioredis.from_url(redis_url)
+        if self._redis is not None:
+            self._next_script = self._redis.register_script(_NEXT_NONCE_SCRIPT)
+            self._release_script = self._redis.register_script(_RELEASE_NONCE_SCRIPT)
+            self._seed_script = self._redis.register_script(_SEED_NONCE_SCRIPT)
+        # Local mode: the next new nonce to hand out, and a min-heap of released ones
+        self._next = None
+        self._free = []
+        # Nonces whose send failed in transit (timeout, 5xx, ...): the node may or may not have them
+        self._uncertain = set()
+        self._seeded = False
+
+    @property
+    def needs_seed(self) -> bool:
+        # Uncertain nonces are settled against the next pending count, so ask for one
+        return not self._seeded or bool(self._uncertain)
+
+    async def seed(self, pending_nonce: int):
+        """
+        Initializes the counter from the on-chain pending count, or catches it up if txs were sent elsewhere.
+        Uncertain nonces at or above the pending count never reached the node and are released for reuse.
+        """
+        if self._redis is not None:
+            await self._seed_script(keys=[self.key, self.free_key], args=[pending_nonce])
+        else:
+            if self._next is None or self._next < pending_nonce:
+                self._next = pending_nonce
+            self._free = [n for n in self._free if n >= pending_nonce]
+            heapq.heapify(self._free)
+        self._seeded = True
+        uncertain, self._uncertain = self._uncertain, set()
+        for nonce in uncertain:
+            if nonce >= pending_nonce:
+                await self.release(nonce)
+
+    async def next(self) -> int:
+        if self._redis is not None:
+            return int(await self._next_script(keys=[self.key, self.free_key]))
+        if self._free:
+            return heapq.heappop(self._free)
+        nonce = self._next
+        self._next += 1
+        return nonce
+
+    async def release(self, nonce: int):
+        """Gives back `nonce` after the node rejected its tx, so the next call to `next()` reuses it."""
+        if self._redis is not None:
+            await self._release_script(keys=[self.key, self.free_key], args=[nonce])
+        elif nonce < self._next and nonce not in self._free:
+            heapq.heappush(self._free, nonce)
+
+    def mark_uncertain(self, nonce: int):
+        """Records that `nonce`'s send failed in transit; it is settled on the next `seed()`."""
+        self._uncertain.add(nonce)
+
+    async def resync(self, pending_nonce: int):
+        """Resets the counter so the next call to `next()` returns `pending_nonce`."""
+        async with self._lock:
+            if self._redis is not None:
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    pipe.set(self.key, pending_nonce - 1)
+                    pipe.delete(self.free_key)
+                    await pipe.execute()
+            else:
+                self._next = pending_nonce
+                self._free = []
+            self._uncertain = set()
+            self._seeded = True
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+
 class BlockchainService:
     def __init__(self):
         self.rpc_url = os.getenv("TESTNET_RPC_URL")
@@ -25,29 +228,188 @@ class BlockchainService:
         if not all([self.rpc_url, self.agent_eoa_address, self.agent_eoa_private_key, self.thank_you_token_address]):
             raise ValueError("Missing blockchain config in .env for backend")
 
-        self.w3 = Web3(Web3.HTTPProvider(self.rpc_url))
-        self.w3.middleware_onion.inject(geth_poa_middleware, layer=0) # Important for LUKSO Testnet
-
-        if not self.w3.is_connected():
-            raise ConnectionError("Failed to connect to blockchain RPC")
+        # Async provider so RPC round-trips don't block the FastAPI event loop.
+        # The HTTP session is attached and the connection checked in `connect()`.
+        self.w3 = AsyncWeb3(AsyncHTTPProvider(self.rpc_url))
+        self.w3.middleware_onion.inject(async_geth_poa_middleware, layer=0) # Important for LUKSO Testnet
+        self.w3.middleware_onion.add(immutable_rpc_cache_middleware, name="immutable_rpc_cache")
+        self._session = None
 
         self.account = self.w3.eth.account.from_key(self.agent_eoa_private_key)
         assert self.account.address == self.agent_eoa_address, "Mismatch between agent EOA address and private key!"
 
-    def get_up_owner(self, up_address: str) -> str:
-        up_contract = self.w3.eth.contract(address=Web3.to_checksum_address(up_address), abi=UP_ABI)
-        return up_contract.functions.owner().call() # This is the KeyManager address
+        # ECDSA signing takes milliseconds of CPU; keep it off the event loop thread
+        self._sign_pool = ThreadPoolExecutor(max_workers=SIGNING_THREADS)
+
+        # Seeded once from the pending count, then incremented per send. Set REDIS_URL when running
+        # several uvicorn workers so they share one counter instead of racing each other for nonces.
+        self._nonces = NonceManager(self.account.address, os.getenv("REDIS_URL"))
+
+        # Fee data (timestamp, maxFeePerGas, maxPriorityFeePerGas), and (timestamp, padded gas limit)
+        # per target contract and function (see _gas_key)
+        self._fee_cache = None
+        self._gas_estimates = {}
+
+        # UP address -> (timestamp, KeyManager address)
+        self._up_owner_cache = {}
+
+        # UP address -> queued (data key, data value, future for the tx hash), and the task that will flush them
+        self._pending_data = {}
+        self._flush_tasks = {}
+
+        # tx hash -> background task waiting for its receipt, so /tx-status polls don't each hit the RPC
+        self._receipt_tasks = {}
+
+        # LSP7 transfers are hand-encoded (encode_lsp7_transfer), so no token Contract object is needed
+        self.token_address = _cksum(self.thank_you_token_address)
 
-    def _send_transaction(self, tx):
-        nonce = self.w3.eth.get_transaction_count(self.account.address)
-        tx['nonce'] = nonce
-        tx['gas'] = self.w3.eth.estimate_gas(tx) # Estimate gas
-        tx['gasPrice'] = self.w3.eth.gas_price # Use current gas price
+    async def connect(self):
+        """Attaches a pooled aiohttp session to the provider and checks the RPC is reachable. Call once at startup."""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=RPC_CONNECTION_POOL_SIZE))
+            await self.w3.provider.cache_async_session(self._session)
+        if not await self.w3.is_connected():
+            raise ConnectionError("Failed to connect to blockchain RPC")
+
+    async def close(self):
+        await self._nonces.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @functools.lru_cache(maxsize=256)
+    def _up_contract(self, up_address: str):
+        return self.w3.eth.contract(address=_cksum(up_address), abi=UP_ABI)
+
+    @functools.lru_cache(maxsize=256)
+    def _key_manager_contract(self, key_manager_address: str):
+        return self.w3.eth.contract(address=_cksum(key_manager_address), abi=LSP6_KEY_MANAGER_ABI)
+
+    async def get_up_owner(self, up_address: str) -> str:
+        cached = self._up_owner_cache.get(up_address)
+        if cached is not None and time.time() - cached[0] < UP_OWNER_CACHE_TTL_SECONDS:
+            return cached[1]
+        owner = await self._up_contract(up_address).functions.owner().call() # This is the KeyManager address
+        self._up_owner_cache[up_address] = (time.time(), owner)
+        return owner
+
+    async def _fetch_pending_nonce(self) -> int:
+        return await self.w3.eth.get_transaction_count(self.account.address, 'pending')
+
+    def _fee_history_is_stale(self) -> bool:
+        return self._fee_cache is None or time.time() - self._fee_cache[0] >= FEE_CACHE_TTL_SECONDS
+
+    def _update_fee_cache(self, history):
+        base_fee = history['baseFeePerGas'][-1] # Base fee of the next block
+        tips = sorted(reward[0] for reward in history['reward'])
+        priority_fee = tips[len(tips) // 2] # Median tip over the last blocks
+        # 2x base fee keeps the tx valid through a few full blocks of base fee increases
+        self._fee_cache = (time.time(), 2 * base_fee + priority_fee, priority_fee)
+
+    @staticmethod
+    def _gas_key(tx):
+        """Cache key for `tx`'s gas estimate, or None if its gas must be estimated every time."""
+        selector = tx['data'][:10] # '0x' + 4-byte selector
+        if selector in _UNCACHED_GAS_SELECTORS:
+            return None
+        # Calldata length too, so e.g. a 5-key setDataBatch doesn't reuse a 1-key estimate
+        return (tx['to'], selector, len(tx['data']))
+
+    async def _preflight(self, tx):
+        """
+        Concurrently fetches whichever of pending nonce, gas estimate and fee history are not cached yet.
+        A fetched pending nonce seeds the nonce counter. Sets tx['gas'].
+        """
+        gas_key = self._gas_key(tx)
+        cached_gas = self._gas_estimates.get(gas_key)
+        calls = {}
+        if self._nonces.needs_seed:
+            calls['nonce'] = lambda: self.w3.eth.get_transaction_count(self.account.address, 'pending')
+        if cached_gas is None or time.time() - cached_gas[0] > GAS_ESTIMATE_TTL_SECONDS:
+            calls['gas'] = lambda: self.w3.eth.estimate_gas(tx)
+        if self._fee_history_is_stale():
+            calls['fees'] = lambda: self.w3.eth.fee_history(5, 'latest', [50])
+
+        # Independent reads: issue them concurrently so latency is the slowest call, not the sum
+        results = dict(zip(calls, await asyncio.gather(*(fetch() for fetch in calls.values()))))
+
+        if 'gas' in results:
+            tx['gas'] = int(results['gas'] * GAS_ESTIMATE_PADDING)
+            if gas_key is not None:
+                self._gas_estimates[gas_key] = (time.time(), tx['gas'])
+        else:
+            tx['gas'] = cached_gas[1]
+        if 'fees' in results:
+            self._update_fee_cache(results['fees'])
+        if 'nonce' in results:
+            await self._nonces.seed(results['nonce'])
+
+    async def _sign(self, tx):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._sign_pool, self.account.sign_transaction, tx)
+
+    async def _send_with_next_nonce(self, tx):
+        nonce = tx['nonce'] = await self._nonces.next()
+        try:
+            signed_tx = await self._sign(tx)
+            return await self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        except ValueError as e:
+            # JSON-RPC rejection (insufficient funds, underpriced, ...): the nonce was never used, so the next
+            # send takes it. Nonce errors are left to the caller's resync.
+            if not _is_nonce_error(e):
+                await self._nonces.release(nonce)
+            raise
+        except (Exception, asyncio.CancelledError):
+            # Transport error, timeout or cancellation: the node may already have the tx, so don't reuse it blindly
+            self._nonces.mark_uncertain(nonce)
+            raise
+
+    async def _submit(self, tx) -> str:
+        """Signs and broadcasts `tx` and starts waiting for its receipt in the background. Returns the tx hash."""
+        await self._preflight(tx)
+        tx['maxFeePerGas'], tx['maxPriorityFeePerGas'] = self._fee_cache[1], self._fee_cache[2]
         tx['chainId'] = self.chain_id
 
-        signed_tx = self.w3.eth.account.sign_transaction(tx, self.agent_eoa_private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        try:
+            tx_hash = await self._send_with_next_nonce(tx)
+        except ValueError as e:
+            if not _is_nonce_error(e):
+                raise
+            # Our counter drifted (tx sent elsewhere, node restarted, ...): re-sync once and retry
+            await self._nonces.resync(await self._fetch_pending_nonce())
+            tx_hash = await self._send_with_next_nonce(tx)
+
+        tx_hash = Web3.to_hex(tx_hash)
+        if len(self._receipt_tasks) >= MAX_TRACKED_RECEIPTS:
+            self._receipt_tasks = {h: t for h, t in self._receipt_tasks.items() if not t.done()}
+        task = asyncio.create_task(self._await_receipt(tx_hash, self._gas_key(tx), tx['gas']))
+        task.add_done_callback(_log_receipt_failure)
+        self._receipt_tasks[tx_hash] = task
+        return tx_hash
+
+    async def _await_receipt(self, tx_hash: str, gas_key, gas: int):
+        receipt = await self.w3.eth.wait_for_transaction_receipt(tx_hash, poll_latency=RECEIPT_POLL_LATENCY_SECONDS)
+        # Reverted after using its whole gas limit: most likely out of gas, so drop the estimate it came from
+        if receipt['status'] == 0 and receipt['gasUsed'] == gas:
+            cached_gas = self._gas_estimates.get(gas_key)
+            if cached_gas is not None and cached_gas[1] == gas:
+                del self._gas_estimates[gas_key]
+        return receipt
+
+    async def get_transaction_receipt(self, tx_hash: str):
+        """Returns the receipt for `tx_hash`, or None while it is still pending."""
+        task = self._receipt_tasks.get(tx_hash)
+        if task is not None:
+            if not task.done():
+                return None
+            del self._receipt_tasks[tx_hash]
+            if task.exception() is None:
+                return task.result()
+            # The background wait timed out or failed; fall through to a direct lookup
+        try:
+            return await self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
 
     async def execute_via_key_manager(self, up_address: str, target_contract_address: str, encoded_payload: str):
         """
@@ -55,8 +417,8 @@ class BlockchainService:
         Assumes agent EOA has 'EXECUTE_RELAY_CALL' or general 'CALL' permission set on KeyManager.
         Or, if KeyManager is the UP owner, uses execute function with proper ABI.
         """
-        key_manager_address = self.get_up_owner(up_address)
-        km_contract = self.w3.eth.contract(address=Web3.to_checksum_address(key_manager_address), abi=LSP6_KEY_MANAGER_ABI)
+        key_manager_address = await self.get_up_owner(up_address)
+        km_contract = self._key_manager_contract(key_manager_address)
 
         # This example assumes the LSP6 execute function.
         # If using executeRelayCall, you need the relayCall ABI on KM and specific permission.
@@ -74,9 +436,9 @@ class BlockchainService:
 
         # If the AGENT_EOA needs to execute a function *on the UP itself* (like setDataBatch),
         # it would call the UP's setDataBatch.
-        if Web3.to_checksum_address(target_contract_address) == Web3.to_checksum_address(up_address):
+        if _cksum(target_contract_address) == _cksum(up_address):
             # This case is for calling a function on the UP itself (e.g. setDataBatch)
-            up_contract_for_agent = self.w3.eth.contract(address=Web3.to_checksum_address(up_address), abi=UP_ABI)
+            up_contract_for_agent = self._up_contract(up_address)
             # Assume encoded_payload is for setDataBatch(bytes[] keys, bytes[] values)
             # This needs to be correctly unpacked or the function call built differently.
             # For simplicity, let's assume encoded_payload is the *entire* calldata for the target function
@@ -92,22 +454,57 @@ class BlockchainService:
         # it calls that contract directly. The KeyManager's permission on AGENT_EOA allows this.
         # The tx 'from' will be AGENT_EOA_ADDRESS.
         # tx = {
-        #     'to': Web3.to_checksum_address(target_contract_address),
+        #     'to': _cksum(target_contract_address),
         #     'value': 0,
         #     'data': encoded_payload, # This must be the full calldata for the target function
         #     'from': self.agent_eoa_address # Important: transaction is from agent
         # }
-        # return self._send_transaction(tx)
-        print(f"Simulating tx to {target_contract_address} with payload {encoded_payload}")
+        # tx_hash = await self._submit(tx)
+        fn = _FN_BY_SELECTOR.get(Web3.to_bytes(hexstr=encoded_payload)[:4])
+        print(f"Simulating tx to {target_contract_address} calling {fn['name'] if fn else 'unknown function'} with payload {encoded_payload}")
         return {"status": "simulated_success", "txHash": "0xsimulated"}
 
 
+    async def _queue_set_data(self, up_address: str, key: bytes, value: bytes) -> str:
+        """
+        Queues a data key/value write on `up_address`. All writes queued for the same UP within
+        SET_DATA_BATCH_WINDOW_SECONDS go out as one setDataBatch tx; returns that tx's hash.
+        """
+        up_address = _cksum(up_address)
+        tx_hash = asyncio.get_running_loop().create_future()
+        self._pending_data.setdefault(up_address, []).append((key, value, tx_hash))
+        if up_address not in self._flush_tasks:
+            self._flush_tasks[up_address] = asyncio.create_task(self._flush_set_data(up_address))
+        return await tx_hash
+
+    async def _flush_set_data(self, up_address: str):
+        await asyncio.sleep(SET_DATA_BATCH_WINDOW_SECONDS)
+        del self._flush_tasks[up_address]
+        pending = self._pending_data.pop(up_address)
+        try:
+            tx_data = self._up_contract(up_address).encodeABI(
+                fn_name="setDataBatch", args=[[key for key, _, _ in pending], [value for _, value, _ in pending]]
+            )
+            tx_hash = await self._submit({
+                'to': up_address,
+                'value': 0,
+                'data': tx_data,
+                'from': self.agent_eoa_address
+            })
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, _, future in pending:
+            if not future.done():
+                future.set_result(tx_hash)
+
     async def make_post(self, up_address: str, post_content_cid: str):
         """
         Creates a simple post by setting LSP12IssuedAssets data on the UP.
         This requires the agent EOA to have SETDATA permission on the UP.
         """
-        up_contract = self.w3.eth.contract(address=Web3.to_checksum_address(up_address), abi=UP_ABI)
         # This is a simplified example. Real LSP12 involves more keys.
         # You'd typically use lsp-utils or erc725.js to construct these payloads.
         # For a post, you might add an asset to LSP12IssuedAssets and link its metadata.
@@ -130,43 +527,31 @@ class BlockchainService:
         mock_key = Web3.keccak(text=f"MyProfilePost_{post_content_cid}")[:32] # Just an example
         mock_value = Web3.to_bytes(hexstr=post_content_cid) # Assuming CID is hex
 
-        tx_data = up_contract.encodeABI(fn_name="setDataBatch", args=[[mock_key], [mock_value]])
-
-        tx = {
-            'to': Web3.to_checksum_address(up_address),
-            'value': 0,
-            'data': tx_data,
-            'from': self.agent_eoa_address
-        }
         print(f"Attempting to post to UP {up_address} via agent {self.agent_eoa_address}")
-        return self._send_transaction(tx)
+        tx_hash = await self._queue_set_data(up_address, mock_key, mock_value)
+        return {"status": "submitted", "txHash": tx_hash}
 
 
     async def send_thank_you_token(self, up_address_of_sender: str, to_address: str, amount: int):
-        token_contract = self.w3.eth.contract(address=Web3.to_checksum_address(self.thank_you_token_address), abi=LSP7_ABI)
-        
         # The agent EOA calls `transfer` on the token contract.
         # The `from` in the LSP7 transfer function is the UP of the user whose tokens are being sent.
         # The transaction itself is signed by and sent from the AGENT_EOA.
         # The KeyManager of `up_address_of_sender` must allow AGENT_EOA to make this call.
-        tx_data = token_contract.encodeABI(
-            fn_name="transfer",
-            args=[
-                Web3.to_checksum_address(up_address_of_sender), # from (the UP whose tokens are moved)
-                Web3.to_checksum_address(to_address),           # to
-                amount,                                         # amount
-                True,                                           # force (allow sending to EOA)
-                b''                                             # data
-            ]
+        tx_data = encode_lsp7_transfer(
+            _cksum(up_address_of_sender),                       # from (the UP whose tokens are moved)
+            _cksum(to_address),                                 # to
+            amount,                                             # amount
+            force=True,                                         # allow sending to EOA
         )
         tx = {
-            'to': Web3.to_checksum_address(self.thank_you_token_address),
+            'to': self.token_address,
             'value': 0,
             'data': tx_data,
             'from': self.agent_eoa_address # tx is initiated by agent
         }
         print(f"Attempting to send TYT from {up_address_of_sender} to {to_address} via agent {self.agent_eoa_address}")
-        return self._send_transaction(tx)
+        tx_hash = await self._submit(tx)
+        return {"status": "submitted", "txHash": tx_hash}
 
     async def follow_profile(self, user_up_address: str, target_up_to_follow: str):
         # "Following" can be implemented in various ways on LUKSO.
@@ -176,10 +561,12 @@ class BlockchainService:
         # Key: keccak256("MyFollowingList")
         # Value: JSON string array of followed UP addresses, or a Link/Relay type if more complex.
         # This is similar to make_post, using setDataBatch on the user's UP.
-        print(f"Simulating UP {user_up_address} following {target_up_to_follow}")
-        # This would also use setDataBatch on the user_up_address, signed by agent_eoa_address
-        # Similar to make_post, payload construction is key.
-        return {"status": "simulated_follow_success", "txHash": "0xsimulated_follow"}
+        # Simplified (not LSP compliant): one custom key per followed profile, valued with its address.
+        key = Web3.keccak(text=f"MyFollowing_{_cksum(target_up_to_follow)}")
+        value = Web3.to_bytes(hexstr=_cksum(target_up_to_follow))
+        print(f"Attempting UP {user_up_address} following {target_up_to_follow} via agent {self.agent_eoa_address}")
+        tx_hash = await self._queue_set_data(user_up_address, key, value)
+        return {"status": "submitted", "txHash": tx_hash}
 
     async def get_profile_metrics(self, up_address: str):
         # This is a placeholder. In reality, you'd query an indexer (Blockscout, Subgraph, Subsquid)
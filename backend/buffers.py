@@ -0,0 +1,46 @@
+# backend/rl_agent/buffers.py
+import numpy as np
+from stable_baselines3.common.buffers import ReplayBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+
+class FastReplayBuffer(ReplayBuffer):
+    """
+    Drop-in ReplayBuffer for small flat observations. Each sampled transition is one flat index
+    into the (step, env) storage, so every field is a single fancy-index gather, and dones are
+    stored with timeouts already masked out instead of masking them on every sample.
+    """
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        pos = self.pos
+        super().add(obs, next_obs, action, reward, done, infos)
+        # Only use dones that are not due to timeouts (timeouts stay False unless handle_timeout_termination)
+        self.dones[pos] *= 1 - self.timeouts[pos]
+
+    def sample(self, batch_size: int, env=None) -> ReplayBufferSamples:
+        if env is not None: # VecNormalize statistics need the per-field normalization of the base class
+            return super().sample(batch_size, env=env)
+        n_envs = self.n_envs
+        if self.optimize_memory_usage and self.full:
+            # obs and next_obs share one array: skip step `self.pos`, whose next_obs was already overwritten
+            flat = np.random.randint(n_envs, self.buffer_size * n_envs, size=batch_size)
+            steps = (flat // n_envs + self.pos) % self.buffer_size
+            flat = steps * n_envs + flat % n_envs
+        else:
+            upper = self.buffer_size if self.full else self.pos
+            flat = np.random.randint(0, upper * n_envs, size=batch_size)
+            steps = flat // n_envs
+
+        # (buffer_size, n_envs, ...) storage viewed as (buffer_size * n_envs, ...): no copies until the gathers
+        observations = self.observations.reshape(self.buffer_size * n_envs, -1)
+        if self.optimize_memory_usage:
+            next_obs = observations[((steps + 1) % self.buffer_size) * n_envs + flat % n_envs]
+        else:
+            next_obs = self.next_observations.reshape(self.buffer_size * n_envs, -1)[flat]
+        data = (
+            observations[flat],
+            self.actions.reshape(self.buffer_size * n_envs, -1)[flat],
+            next_obs,
+            self.dones.reshape(-1)[flat].reshape(-1, 1),
+            self.rewards.reshape(-1)[flat].reshape(-1, 1),
+        )
+        return ReplayBufferSamples(*map(self.to_torch, data))
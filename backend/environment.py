@@ -2,23 +2,94 @@
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
-import random
+import os
 from .blockchain import blockchain_service # Assuming blockchain.py is in the same directory
-
-class SocialEnv(gym.Env):
+from .metrics import (FOLLOWERS, POSTS_COUNT, ENGAGEMENT_RATE, MAX_FOLLOWERS, MAX_POSTS, MAX_ENGAGEMENT_RATE,
+                      NORM, INV_NORM)
+
+# Kernels use Numba's on-disk cache (cache=True), so other processes (uvicorn workers, SubprocVecEnv
+# workers) load them instead of recompiling. Numba keeps it next to this file, or in the per-user cache
+# directory if that is read-only; deployments can point NUMBA_CACHE_DIR elsewhere.
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError: # Numba is optional; without it the kernels below run as plain Python
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+# Uniform draws consumed by _apply_action per step, and how many steps' worth SocialEnvSim draws at once
+UNIFORMS_PER_STEP = 6
+RAND_BUF_ROWS = 1024
+ACTION_COST = 0.05 # Small cost for any action (e.g. gas)
+# Subtracted when the same action is taken 3 times in a row. Training passes repetition_penalty=0.0,
+# matching the reward the policy was originally trained on (the old SimplifiedSocialEnv had no penalty).
+REPETITION_PENALTY = 0.1
+
+@njit(cache=True, fastmath=True)
+def _apply_action(action, metrics, u, max_engagement_rate):
+    """
+    Simulates the effect of `action` plus organic drift on `metrics` (updated in place), using
+    the uniform [0, 1) draws in `u` (UNIFORMS_PER_STEP) as its only source of randomness.
+    Returns the action's reward, before the repetition penalty and action cost.
+    """
+    reward = 0.0
+    if action == 0: # Make a post
+        metrics[POSTS_COUNT] += 1
+        # Small positive for posting, larger if it leads to engagement
+        reward += 0.1 + (0.2 * u[0] if metrics[ENGAGEMENT_RATE] > 0.05 else 0.0)
+    elif action == 1: # Follow a profile
+        # 20% chance of positive interaction, small chance of immediate follower gain
+        reward += 0.05 + (0.15 * u[0] if u[1] < 0.2 else 0.0)
+        metrics[FOLLOWERS] += 1.0 if u[2] < 0.5 else 0.0
+    elif action == 2: # Reward an active follower
+        reward += 0.1 + 0.2 * u[0] if metrics[ENGAGEMENT_RATE] > 0.03 else -0.05
+        metrics[ENGAGEMENT_RATE] *= 1.0 + 0.05 * u[3] # Slight engagement boost
+
+    # Organic growth/loss (uniform over -1..2) and engagement fluctuation
+    metrics[FOLLOWERS] = max(0.0, metrics[FOLLOWERS] + np.floor(4.0 * u[4]) - 1.0)
+    metrics[ENGAGEMENT_RATE] = min(max(metrics[ENGAGEMENT_RATE] * (0.98 + 0.04 * u[5]), 0.0), max_engagement_rate)
+    return reward
+
+@njit(cache=True, fastmath=True)
+def _normalize(metrics, inv_scale, out):
+    """Writes `metrics * inv_scale`, clipped to [0, 1], into `out` and returns it."""
+    for i in range(out.shape[0]):
+        out[i] = min(max(metrics[i] * inv_scale[i], 0.0), 1.0)
+    return out
+
+def _precompile():
+    # Compile (or load from Numba's cache) both kernels now, so the first step doesn't stall on JIT
+    metrics = np.zeros(3, dtype=np.float32)
+    _apply_action(0, metrics, np.zeros(UNIFORMS_PER_STEP, dtype=np.float64), MAX_ENGAGEMENT_RATE)
+    _normalize(metrics, INV_NORM, np.empty(3, dtype=np.float32))
+
+# Set PRECOMPILE_KERNELS=false to defer compilation to the first step instead
+if NUMBA_AVAILABLE and os.getenv("PRECOMPILE_KERNELS", "true").lower() == "true":
+    _precompile()
+
+class SocialEnvSim(gym.Env):
+    """
+    Pure simulation of a UP's social metrics with plain synchronous reset/step, so SB3 can
+    train on it directly. No blockchain calls; see SocialEnv for the live variant.
+    """
     metadata = {'render_modes': ['human'], 'render_fps': 30}
 
-    def __init__(self, up_address: str):
+    def __init__(self, up_address: str = None, seed=None, repetition_penalty: float = REPETITION_PENALTY):
         super().__init__()
         self.up_address = up_address
+        self.repetition_penalty = repetition_penalty
         self.action_history_limit = 10 # Remember last N actions to avoid repetition
         self.action_history = []
 
         # Observation space: [followers_normalized, posts_count_normalized, engagement_rate_normalized, time_since_last_post_norm, ... potentially more features]
         # Normalize values roughly between 0 and 1. Max values are estimates.
-        self.max_followers = 10000
-        self.max_posts = 1000
-        self.max_engagement_rate = 0.5 # e.g. 50%
+        self.max_followers = MAX_FOLLOWERS
+        self.max_posts = MAX_POSTS
+        self.max_engagement_rate = MAX_ENGAGEMENT_RATE
         self.max_time_since_last_action = 7*24*60 # 1 week in minutes, or steps
 
         # Add features for recent action types to discourage spamming the same action
@@ -37,108 +108,93 @@ class SocialEnv(gym.Env):
 
         # Initial state (will be fetched in reset)
         self.state = np.zeros(self.observation_space.shape, dtype=np.float32)
-
-
-    async def _get_observation(self):
-        # In a real scenario, fetch from blockchain_service or an indexer
-        # metrics = await blockchain_service.get_profile_metrics(self.up_address) # async call
-        # For now, simulate metrics based on previous actions or random
-        # This needs to be synchronous for stable_baselines3 or use an async wrapper for the env
-
-        # SIMULATED: For stable_baselines3, this needs to be synchronous.
-        # We'll use placeholder logic. In a real app, the env might need to run in its own async loop
-        # and provide observations synchronously when polled by the agent.
-        
-        # Placeholder: slightly improve metrics if certain actions were taken
-        # This is where the core simulation logic for training would go if not using live data.
-        # For a live agent, this would fetch real data.
-        
-        # For now, let's use random data for a non-training 'live' agent and assume metrics are passed in.
-        # During training, this would be more sophisticated.
-        # Let's assume the `step` and `reset` methods will update a self.metrics dictionary
-        # For this example, we'll just generate random metrics.
-        
-        # This function will be called by `reset` and `step`
-        # For now, let's assume self.metrics is populated by some external process or simulation
-        if not hasattr(self, 'simulated_metrics'):
-             self.simulated_metrics = {
-                "followers": random.randint(10, self.max_followers // 2),
-                "posts_count": random.randint(5, self.max_posts // 2),
-                "engagement_rate": round(random.uniform(0.01, self.max_engagement_rate / 2), 3)
-            }
-
-        obs = np.array([
-            self.simulated_metrics["followers"] / self.max_followers,
-            self.simulated_metrics["posts_count"] / self.max_posts,
-            self.simulated_metrics["engagement_rate"] / self.max_engagement_rate,
-        ], dtype=np.float32)
-        return np.clip(obs, 0, 1) # Ensure values are within bounds
-
-    async def reset(self, seed=None, options=None):
-        super().reset(seed=seed)
+        # [followers, posts_count, engagement_rate]; every reset overwrites it in place with the episode's starting metrics.
+        # float32 like the observations, so normalizing never converts (counts stay exact up to 2**24).
+        self.simulated_metrics = np.zeros(3, dtype=np.float32)
+        # Bounds of the initial follower and post counts drawn by each reset
+        self._initial_low = np.array([10, 5])
+        self._initial_high = np.array([self.max_followers // 2, self.max_posts // 2])
+
+        # Normalization is a single in-place multiply into a reused buffer
+        self._inv_scale = INV_NORM
+        self._obs_buf = np.empty(3, dtype=np.float32)
+
+        self._rng = np.random.default_rng(seed)
+        # Uniform draws are generated RAND_BUF_ROWS steps at a time; each step consumes one row
+        self._rand_buf = self._rng.random((RAND_BUF_ROWS, UNIFORMS_PER_STEP))
+        self._rand_idx = 0
+
+    def _get_observation(self):
+        # Pure projection of the current metrics; live metrics are fetched once per episode by SocialEnv.reset,
+        # since stable_baselines3 needs this to stay synchronous.
+        # Normalized and clipped to [0, 1] in a compiled kernel.
+        # NOTE: the same buffer is returned every call; reset/step hand out copies
+        return _normalize(self.simulated_metrics, self._inv_scale, self._obs_buf)
+
+    def _random_metrics(self):
+        # [followers, posts_count, engagement_rate], see FOLLOWERS / POSTS_COUNT / ENGAGEMENT_RATE.
+        # Drawn straight into the episode's metrics array, both counts in a single integers() call.
+        m = self.simulated_metrics
+        m[FOLLOWERS:POSTS_COUNT + 1] = self._rng.integers(self._initial_low, self._initial_high, endpoint=True)
+        m[ENGAGEMENT_RATE] = round(self._rng.uniform(0.01, self.max_engagement_rate / 2), 3)
+        return m
+
+    def _start_episode(self, metrics):
         self.current_step = 0
         self.action_history = []
-        # Fetch initial metrics for the UP (or use simulation)
-        self.simulated_metrics = await blockchain_service.get_profile_metrics(self.up_address) # Initial fetch
-        self.state = await self._get_observation()
+        if metrics is not self.simulated_metrics:
+            self.simulated_metrics[:] = metrics
+        # Copy out of the shared buffer: callers (e.g. SB3's terminal_observation) keep returned observations
+        self.state = self._get_observation().copy()
         return self.state, {} # obs, info
 
-    async def step(self, action: int):
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        if seed is not None:
+            self._rng = np.random.default_rng(seed)
+            self._rng.random(out=self._rand_buf)
+            self._rand_idx = 0
+        return self._start_episode(self._random_metrics())
+
+    def step(self, action: int):
+        # Hot loop during training: attributes used more than once are read into locals once
         self.current_step += 1
         terminated = False
         truncated = False
-        reward = 0
+        metrics = self.simulated_metrics
         
         # Store action to discourage repetition if needed
-        self.action_history.append(action)
-        if len(self.action_history) > self.action_history_limit:
-            self.action_history.pop(0)
+        history = self.action_history
+        history.append(action)
+        if len(history) > self.action_history_limit:
+            history.pop(0)
 
         # --- SIMULATE ACTION EFFECT & CALCULATE REWARD ---
         # This is the core of the RL environment's dynamics.
         # For a real agent, you'd execute the action on-chain and then observe the new state.
         # For training, you'd simulate this.
-        
-        # Placeholder target addresses for follow/reward
-        placeholder_target_up = "0xSomeOtherUserProfileAddress" # Replace with actual or dynamically chosen
-        placeholder_amount_tyt = 1 * (10**18) # 1 TYT token (assuming 18 decimals)
-
-        action_cost = 0.05 # Small cost for any action (e.g. gas)
-
-        if action == 0: # Make a post
-            # print(f"Env: Simulating action 'Make Post' for {self.up_address}")
-            # In a real agent: await blockchain_service.make_post(self.up_address, "ipfs://some_content_cid")
-            self.simulated_metrics["posts_count"] += 1
-            # Reward: Small positive for posting, larger if it leads to engagement
-            reward += 0.1 + (random.uniform(0, 0.2) if self.simulated_metrics["engagement_rate"] > 0.05 else 0)
-        elif action == 1: # Follow a profile
-            # print(f"Env: Simulating action 'Follow Profile' {placeholder_target_up} for {self.up_address}")
-            # In a real agent: await blockchain_service.follow_profile(self.up_address, placeholder_target_up)
-            # Reward: Small positive, larger if it leads to follow-back or network growth
-            reward += 0.05 + (random.uniform(0, 0.15) if random.random() < 0.2 else 0) # 20% chance of positive interaction
-            self.simulated_metrics["followers"] += random.randint(0,1) # Small chance of immediate follower gain
-        elif action == 2: # Reward an active follower
-            # print(f"Env: Simulating action 'Reward Follower' {placeholder_target_up} for {self.up_address}")
-            # In a real agent: await blockchain_service.send_thank_you_token(self.up_address, placeholder_target_up, placeholder_amount_tyt)
-            # Reward: Neutral base, positive if it boosts overall engagement or follower loyalty
-            reward += 0.0 + (random.uniform(0.1, 0.3) if self.simulated_metrics["engagement_rate"] > 0.03 else -0.05)
-            self.simulated_metrics["engagement_rate"] *= random.uniform(1.0, 1.05) # Slight engagement boost
-        
-        # Discourage spamming the same action (example)
-        if len(self.action_history) >=3 and len(set(self.action_history[-3:])) == 1:
-            reward -= 0.1 
 
-        reward -= action_cost # Apply action cost
+        # In a real agent the action would be executed on-chain instead, e.g. with a placeholder target
+        # "0xSomeOtherUserProfileAddress" and 1 TYT (1 * 10**18, assuming 18 decimals):
+        # 0: await blockchain_service.make_post(self.up_address, "ipfs://some_content_cid")
+        # 1: await blockchain_service.follow_profile(self.up_address, placeholder_target_up)
+        # 2: await blockchain_service.send_thank_you_token(self.up_address, placeholder_target_up, placeholder_amount_tyt)
+        # The simulated action effect and organic metric drift run in a compiled kernel.
+        idx = self._rand_idx
+        if idx == RAND_BUF_ROWS:
+            self._rng.random(out=self._rand_buf) # Refill in place once every RAND_BUF_ROWS steps
+            idx = 0
+        self._rand_idx = idx + 1
+        reward = _apply_action(action, metrics, self._rand_buf[idx], self.max_engagement_rate)
 
-        # Simulate slight organic changes to metrics
-        self.simulated_metrics["followers"] += random.randint(-1, 2) # Organic growth/loss
-        self.simulated_metrics["followers"] = max(0, self.simulated_metrics["followers"])
-        self.simulated_metrics["engagement_rate"] *= random.uniform(0.98, 1.02) # Fluctuation
-        self.simulated_metrics["engagement_rate"] = np.clip(self.simulated_metrics["engagement_rate"], 0, self.max_engagement_rate)
+        # Discourage spamming the same action (example)
+        if len(history) >= 3 and history[-1] == history[-2] == history[-3]:
+            reward -= self.repetition_penalty
 
+        reward -= ACTION_COST # Apply action cost
 
         # Update observation
-        next_obs = await self._get_observation()
+        next_obs = _normalize(metrics, self._inv_scale, self._obs_buf).copy()
         self.state = next_obs
 
         if self.current_step >= self.max_steps_per_episode:
@@ -152,4 +208,21 @@ class SocialEnv(gym.Env):
         pass
 
     def close(self):
-        pass
\ No newline at end of file
+        pass
+
+
+class SocialEnv(SocialEnvSim):
+    """
+    Live variant for the agent path: episodes start from the UP's current metrics
+    fetched via blockchain_service. Steps are still simulated.
+    """
+
+    async def reset(self, seed=None, options=None):
+        gym.Env.reset(self, seed=seed)
+        metrics = await blockchain_service.get_profile_metrics(self.up_address) # Initial fetch
+        return self._start_episode(np.array(
+            [metrics["followers"], metrics["posts_count"], metrics["engagement_rate"]], dtype=np.float32
+        ))
+
+    async def step(self, action: int):
+        return SocialEnvSim.step(self, action)
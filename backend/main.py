@@ -1,15 +1,23 @@
 # backend/rl_agent/main.py
 import asyncio
+import threading
+import aiohttp
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import numpy as np
 import os
+import json
+import torch
 
-from .model import load_rl_model, train_rl_model # .model refers to model.py
-from .environment import SocialEnv # .environment refers to environment.py
+from .model import load_rl_model, load_inference_policy, train_rl_model_async # .model refers to model.py
+from .metrics import NORM, INV_NORM # Constants only: importing .environment would pull in gymnasium and numba
 from .blockchain import blockchain_service, UP_ABI, LSP7_ABI # .blockchain refers to blockchain.py
 from web3 import Web3 # For encoding data for execution
 
+# What the async RPC provider raises when the node is unreachable or slow (aiohttp errors aren't ConnectionErrors)
+RPC_CONNECTION_ERRORS = (ConnectionError, aiohttp.ClientError, asyncio.TimeoutError)
+
 # Load the RL model globally on startup
 # The SocialEnv instance passed here is more for structural compatibility if needed by load.
 # The actual interactions for recommendations will use observations passed in requests.
@@ -18,7 +26,29 @@ from web3 import Web3 # For encoding data for execution
 # For now, let's not pass an env to load_rl_model or pass a dummy one.
 # The `load_rl_model` function was updated to handle this.
 POLICY_PATH = "backend/policy/dqn_social_policy.zip"
-rl_model = load_rl_model(POLICY_PATH) # Loads or initializes a new model
+
+# Inference is a tiny MLP forward per request; extra intra-op threads only add dispatch overhead
+torch.set_num_threads(1)
+rl_model = None
+_rng = np.random.default_rng() # For the random fallback action while no model is loaded
+_policy = None # ONNX Runtime / quantized export of rl_model's Q-network, see load_inference_policy
+
+def set_rl_model(model):
+    global rl_model, _policy
+    if model is None:
+        rl_model = None
+        _policy = None
+        return
+    # Build and warm up the policy before publishing anything, so no request sees a model without its policy
+    policy = load_inference_policy(model)
+    policy.predict(np.zeros(len(NORM), dtype=np.float32)) # Warm up so the first request doesn't pay one-time init costs
+    _policy = policy
+    rl_model = model
+
+# Loads the saved policy (or leaves rl_model None if there is none) in the background, so importing the app
+# doesn't wait on unzipping and torch.load; startup_event waits for it before the app starts serving
+_model_loader = threading.Thread(target=lambda: set_rl_model(load_rl_model(POLICY_PATH)), daemon=True)
+_model_loader.start()
 
 app = FastAPI(
     title="Autonomous Profile Agent RL Backend",
@@ -50,50 +80,40 @@ class ExecuteActionRequest(BaseModel):
 
 @app.on_event("startup")
 async def startup_event():
+    await blockchain_service.connect()
+    await asyncio.to_thread(_model_loader.join) # So the background load can't overwrite a freshly trained model
+
     if not os.path.exists(POLICY_PATH) and os.getenv("TRAIN_MODEL_ON_STARTUP", "false").lower() == "true":
         print("No policy found, and TRAIN_MODEL_ON_STARTUP is true. Training a new model...")
         try:
-            # This is a blocking call if train_rl_model is not fully async
+            # For SB3, training is CPU-bound and sync, so it runs on a worker thread to keep the event loop free.
             # Consider running training as a separate process or background task.
-            # For simplicity in example, direct call.
-            # For SB3, training is CPU-bound and sync, so running in thread executor if FastAPI is async.
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, lambda: asyncio.run(train_rl_model(total_timesteps=10000))) # Small train for startup
-            global rl_model # Reload the newly trained model
-            rl_model = load_rl_model(POLICY_PATH)
+            await train_rl_model_async(total_timesteps=10000) # Small train for startup
+            load_rl_model.cache_clear() # The cached entry is the model from before training
+            set_rl_model(load_rl_model(POLICY_PATH)) # Reload the newly trained model
         except Exception as e:
             print(f"Error during startup model training: {e}")
-            # Fallback to an untrained model structure if training fails
-            if rl_model is None:
-                 # Initialize a basic model structure if load_rl_model didn't handle it
-                from stable_baselines3 import DQN
-                from .model import SimplifiedSocialEnv # Use the sync env for this
-                temp_env = SimplifiedSocialEnv(up_address="0x0")
-                rl_model = DQN("MlpPolicy", temp_env)
-                print("Initialized a default untrained model due to training/loading failure.")
+            # rl_model stays None, so /recommend-action keeps returning random actions
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await blockchain_service.close()
 
 
 @app.post("/recommend-action")
 async def recommend_action(req: ActionRequest):
-    # Normalize observations similar to how SocialEnv does it
-    # These max values should be consistent with SocialEnv's definition
-    # Consider creating a utility in SocialEnv for normalization.
-    temp_env = SocialEnv(up_address=req.up_address) # Create a temp env for normalization constants
-    
-    obs_normalized = np.array([
-        req.followers / temp_env.max_followers,
-        req.posts_count / temp_env.max_posts,
-        req.engagement_rate / temp_env.max_engagement_rate,
-    ], dtype=np.float32)
-    obs_normalized = np.clip(obs_normalized, 0, 1)
-
-    if rl_model is None:
+    # Normalize observations exactly as SocialEnv does (same INV_NORM constants)
+    obs_normalized = np.clip(np.array([req.followers, req.posts_count, req.engagement_rate], dtype=np.float32) * INV_NORM, 0, 1)
+
+    policy = _policy # Read once: set_rl_model may swap it from another thread
+    if policy is None:
         # Fallback: return a random action or a default if model isn't loaded
         print("Warning: RL model not loaded. Returning random action.")
-        return {"action_id": int(np.random.choice([0,1,2])), "action_name": "Random (Model Unloaded)", "recommendation_confidence": 0.0}
+        return {"action_id": int(_rng.integers(3)), "action_name": "Random (Model Unloaded)", "recommendation_confidence": 0.0}
 
-    action_id_array, _states = rl_model.predict(obs_normalized, deterministic=True)
-    action_id = int(action_id_array.item()) # Get single int from numpy array
+    # Same as rl_model.predict(obs, deterministic=True) for DQN: argmax over Q-values
+    action_id = policy.predict(obs_normalized)
 
     action_map = {0: "Make Post", 1: "Follow Profile", 2: "Reward Follower"}
     action_name = action_map.get(action_id, "Unknown Action")
@@ -106,30 +126,31 @@ async def execute_agent_action(req: ExecuteActionRequest):
         raise HTTPException(status_code=500, detail="Agent EOA private key not configured for execution.")
 
     try:
-        tx_receipt = None
+        result = None
         if req.action_id == 0: # Make Post
             if not req.post_content_cid:
                 raise HTTPException(status_code=400, detail="post_content_cid required for posting.")
             print(f"Agent executing 'Make Post' for UP: {req.up_address}, CID: {req.post_content_cid}")
-            tx_receipt = await blockchain_service.make_post(req.up_address, req.post_content_cid)
+            result = await blockchain_service.make_post(req.up_address, req.post_content_cid)
 
         elif req.action_id == 1: # Follow Profile
             if not req.target_address:
                 raise HTTPException(status_code=400, detail="target_address required for follow.")
             print(f"Agent executing 'Follow Profile' for UP: {req.up_address}, Target: {req.target_address}")
-            tx_receipt = await blockchain_service.follow_profile(req.up_address, req.target_address)
+            result = await blockchain_service.follow_profile(req.up_address, req.target_address)
 
         elif req.action_id == 2: # Reward Follower
             if not req.target_address or req.reward_amount_wei is None:
                 raise HTTPException(status_code=400, detail="target_address and reward_amount_wei required for reward.")
             print(f"Agent executing 'Reward Follower' for UP: {req.up_address}, Target: {req.target_address}, Amount: {req.reward_amount_wei}")
-            tx_receipt = await blockchain_service.send_thank_you_token(req.up_address, req.target_address, req.reward_amount_wei)
+            result = await blockchain_service.send_thank_you_token(req.up_address, req.target_address, req.reward_amount_wei)
         else:
             raise HTTPException(status_code=400, detail="Invalid action_id.")
 
-        return {"status": "success", "action_id": req.action_id, "details": tx_receipt}
+        # Transactions are only submitted here; poll /tx-status/{txHash} for the receipt
+        return {"status": "success", "action_id": req.action_id, "details": result}
 
-    except ConnectionError as e:
+    except RPC_CONNECTION_ERRORS as e:
         raise HTTPException(status_code=503, detail=f"Blockchain connection error: {e}")
     except ValueError as e: # Catch contract errors, insufficient funds etc.
         # This will catch `assert`s from web3.py if a tx would fail (e.g. insufficient balance for agent EOA gas)
@@ -139,4 +160,20 @@ async def execute_agent_action(req: ExecuteActionRequest):
         print(f"Unhandled error during action execution: {e}") # Log for debugging
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+@app.get("/tx-status/{tx_hash}")
+async def get_tx_status(tx_hash: str):
+    try:
+        receipt = await blockchain_service.get_transaction_receipt(tx_hash)
+    except RPC_CONNECTION_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Blockchain connection error: {e}")
+    except ValueError as e: # e.g. a malformed tx hash rejected by the node
+        raise HTTPException(status_code=400, detail=f"Blockchain interaction error: {str(e)}")
+    if receipt is None:
+        return JSONResponse(status_code=202, content={"status": "pending", "txHash": tx_hash})
+    return {
+        "status": "confirmed" if receipt["status"] == 1 else "reverted",
+        "txHash": tx_hash,
+        "receipt": json.loads(Web3.to_json(receipt)),
+    }
+
 # To run (from backend directory): uvicorn rl_agent.main:app --host 0.0.0.0 --port 8000 --reload
\ No newline at end of file
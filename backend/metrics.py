@@ -0,0 +1,13 @@
+# backend/rl_agent/metrics.py
+# Metric layout and normalization constants shared by the environments and the API. Kept free of
+# gymnasium / stable_baselines3 / numba imports so the FastAPI workers can import it cheaply.
+import numpy as np
+
+# Layout of the simulated metrics array
+FOLLOWERS, POSTS_COUNT, ENGAGEMENT_RATE = 0, 1, 2
+# Observations are metrics divided by these rough maxima, clipped to [0, 1]
+MAX_FOLLOWERS = 10000
+MAX_POSTS = 1000
+MAX_ENGAGEMENT_RATE = 0.5 # e.g. 50%
+NORM = np.array([MAX_FOLLOWERS, MAX_POSTS, MAX_ENGAGEMENT_RATE], dtype=np.float32)
+INV_NORM = (1.0 / NORM).astype(np.float32) # Normalizing is then a multiply instead of a divide
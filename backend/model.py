@@ -1,9 +1,14 @@
 # backend/rl_agent/model.py
+import asyncio
+import copy
+import functools
+import io
+import multiprocessing
 import os
-import gymnasium as gym
-from stable_baselines3 import DQN
-from stable_baselines3.common.env_util import make_vec_env
-from .environment import SocialEnv # Assuming SocialEnv is in environment.py
+import numpy as np
+import torch
+# stable_baselines3, gymnasium and the environments are imported inside the functions that need them,
+# so importing this module for inference (e.g. load_rl_model_fast) doesn't pull in the training stack
 
 MODEL_PATH = "backend/policy/dqn_social_policy.zip"
 # Critical: The SocialEnv needs a UP address. For training, this could be a dummy or test UP.
@@ -12,136 +17,86 @@ MODEL_PATH = "backend/policy/dqn_social_policy.zip"
 # For simplicity, let's assume a generic model trained on a representative environment.
 DUMMY_UP_FOR_TRAINING = "0x0000000000000000000000000000000000000000" # Placeholder
 
-async def train_rl_model(total_timesteps=10000, save_path=MODEL_PATH):
+def train_rl_model(total_timesteps=10000, save_path=MODEL_PATH, n_envs=1, subproc=False, tb_log_dir: str = None):
+    from stable_baselines3 import DQN
+    from stable_baselines3.common.env_util import make_vec_env
+    from stable_baselines3.common.vec_env import SubprocVecEnv
+    from .environment import SocialEnvSim # Assuming SocialEnv is in environment.py
+    from .vec_env import BatchedSocialEnv
+    from .buffers import FastReplayBuffer
+    from .torch_layers import IdentityExtractor
+
     print(f"Training RL model for {total_timesteps} timesteps...")
-    # Create the environment. For SB3, it needs to be a sync env.
-    # SocialEnv itself is async due to blockchain calls. This is a mismatch.
-    # For training, you'd typically:
-    # 1. Create a fully SIMULATED SocialEnv that doesn't make real async calls.
-    # 2. Or use a wrapper that handles the async nature if SB3 supports it (not typically).
-    # For this example, we'll assume SocialEnv's async parts are placeholders
-    # and it can run "synchronously enough" for a basic training loop.
-    # THIS IS A MAJOR SIMPLIFICATION FOR THE EXAMPLE.
-    # A real async env with SB3 often requires custom loops or libraries like `sb3-contrib`.
-
-    # If SocialEnv has async methods like reset/step, make_vec_env might not work directly.
-    # For now, assuming they can be called and awaited in a simplified loop or adapted.
-    
-    # To make it runnable with SB3 which expects sync envs,
-    # we'd need to adapt SocialEnv or use a sync version for training.
-    # Let's proceed with a conceptual training step, acknowledging this limitation.
-    
-    # Create a lambda that instantiates the environment
-    # This is tricky because SocialEnv constructor takes an arg and reset/step are async
-    # We need a synchronous wrapper or a synchronous version of SocialEnv for SB3.
-    
-    # For the sake of a runnable example, let's assume a simplified sync SocialEnv for training.
-    # This would mean `_get_observation` and `step`'s blockchain calls are fully mocked/simulated.
-    
-    # --- Simplified Sync Env for Training (conceptual) ---
-    class SimplifiedSocialEnv(SocialEnv): # Inherit and override async methods
-        def __init__(self, up_address: str):
-            super().__init__(up_address)
-            # No async blockchain calls here, all simulated
-            print("Using SimplifiedSocialEnv for training (all actions/observations are simulated synchronously)")
-
-        # Override async methods to be sync and use pure simulation
-        def _get_sync_observation(self): # Renamed to avoid clash and indicate sync
-            if not hasattr(self, 'simulated_metrics'):
-                self.simulated_metrics = {
-                    "followers": random.randint(10, self.max_followers // 2),
-                    "posts_count": random.randint(5, self.max_posts // 2),
-                    "engagement_rate": round(random.uniform(0.01, self.max_engagement_rate / 2), 3)
-                }
-            obs = np.array([
-                self.simulated_metrics["followers"] / self.max_followers,
-                self.simulated_metrics["posts_count"] / self.max_posts,
-                self.simulated_metrics["engagement_rate"] / self.max_engagement_rate,
-            ], dtype=np.float32)
-            return np.clip(obs, 0, 1)
-
-        def reset(self, seed=None, options=None): # Sync override
-            super().reset(seed=seed) # Calls gym.Env.reset
-            self.current_step = 0
-            self.action_history = []
-            self.simulated_metrics = { # Initial simulated metrics
-                "followers": random.randint(10, self.max_followers // 2),
-                "posts_count": random.randint(5, self.max_posts // 2),
-                "engagement_rate": round(random.uniform(0.01, self.max_engagement_rate / 2), 3)
-            }
-            self.state = self._get_sync_observation()
-            return self.state, {}
-
-        def step(self, action: int): # Sync override
-            # Call the async step logic but ensure it's effectively sync for simulation
-            # This is where you'd put the pure simulation logic from the async step.
-            # For brevity, copying parts of the async step's simulation logic:
-            self.current_step += 1
-            terminated = False
-            truncated = False
-            reward = 0
-            action_cost = 0.05
-
-            if action == 0: # Make a post
-                self.simulated_metrics["posts_count"] += 1
-                reward += 0.1 + (random.uniform(0, 0.2) if self.simulated_metrics["engagement_rate"] > 0.05 else 0)
-            elif action == 1: # Follow
-                reward += 0.05 + (random.uniform(0, 0.15) if random.random() < 0.2 else 0)
-                self.simulated_metrics["followers"] += random.randint(0,1)
-            elif action == 2: # Reward
-                reward += 0.0 + (random.uniform(0.1, 0.3) if self.simulated_metrics["engagement_rate"] > 0.03 else -0.05)
-                self.simulated_metrics["engagement_rate"] *= random.uniform(1.0, 1.05)
-            
-            reward -= action_cost
-            self.simulated_metrics["followers"] = max(0, self.simulated_metrics["followers"] + random.randint(-1, 2))
-            self.simulated_metrics["engagement_rate"] = np.clip(self.simulated_metrics["engagement_rate"] * random.uniform(0.98, 1.02), 0, self.max_engagement_rate)
-
-            next_obs = self._get_sync_observation()
-            self.state = next_obs
-            if self.current_step >= self.max_steps_per_episode:
-                truncated = True
-            return next_obs, reward, terminated, truncated, {}
-    # --- End of Simplified Sync Env ---
-
-    env_lambda = lambda: SimplifiedSocialEnv(up_address=DUMMY_UP_FOR_TRAINING)
-    vec_env = make_vec_env(env_lambda, n_envs=1) # Use the lambda to create env
-
-    model = DQN('MlpPolicy', vec_env, verbose=1,
+    # SocialEnvSim is the fully simulated, synchronous variant of SocialEnv, so SB3 can step it directly.
+    # No repetition penalty: the reward the original training env (SimplifiedSocialEnv) optimized
+    env_lambda = lambda: SocialEnvSim(up_address=DUMMY_UP_FOR_TRAINING, repetition_penalty=0.0)
+    if n_envs > 1 and subproc:
+        # One SocialEnvSim per worker process: a vec step costs the slowest env's step instead of the sum.
+        # Only pays off once env.step is expensive enough to outweigh the IPC per step.
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        vec_env = make_vec_env(env_lambda, n_envs=n_envs, vec_env_cls=SubprocVecEnv,
+                               vec_env_kwargs=dict(start_method=start_method))
+    elif n_envs > 1:
+        # All envs advance in one vectorized NumPy step instead of n_envs Python-level env.step calls
+        vec_env = BatchedSocialEnv(num_envs=n_envs, repetition_penalty=0.0)
+    else:
+        # A single env goes to DQN as-is; SB3 adds the Monitor + DummyVecEnv wrapping itself
+        vec_env = env_lambda()
+
+    # The Q-network is tiny: use the GPU if there is one, otherwise keep torch to one thread so it doesn't
+    # oversubscribe the cores with the env (or SubprocVecEnv workers)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cpu":
+        torch.set_num_threads(1)
+    # 3 observation features in, 3 Q-values out: half the default [64, 64] MLP is plenty.
+    # Observations are already float32 in [0, 1], so they go to the MLP as-is.
+    policy_kwargs = dict(net_arch=[32, 32], activation_fn=torch.nn.ReLU,
+                         features_extractor_class=IdentityExtractor, normalize_images=False)
+
+    # With several envs the replay fills n_envs times faster per vec step: scale the buffer with it,
+    # and train on larger batches every vec step to keep up with the extra data.
+    # optimize_memory_usage is left off: SB3 only allows it without handle_timeout_termination, which would
+    # treat every (time-limit-only) episode end as terminal, for a saving of a few hundred KB at this obs size.
+    model = DQN('MlpPolicy', vec_env, verbose=1, device=device, policy_kwargs=policy_kwargs,
                 learning_rate=1e-4,
-                buffer_size=50000,
+                buffer_size=20000 * n_envs,
+                replay_buffer_class=FastReplayBuffer,
                 learning_starts=1000,
-                batch_size=32,
+                batch_size=32 if n_envs == 1 else 256,
                 tau=1.0,
                 gamma=0.99,
-                train_freq=4,
+                train_freq=4 if n_envs == 1 else (1, 'step'),
                 gradient_steps=1,
                 exploration_fraction=0.1,
                 exploration_final_eps=0.05,
-                tensorboard_log="./dqn_social_tensorboard/")
+                tensorboard_log=tb_log_dir) # e.g. "./dqn_social_tensorboard/"; off by default to skip the event-file writes
     
     model.learn(total_timesteps=total_timesteps, log_interval=4)
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
     model.save(save_path)
+    export_torchscript(model, scripted_policy_path(save_path))
     print(f"Model trained and saved to {save_path}")
     vec_env.close()
     return model
 
-def load_rl_model(load_path=MODEL_PATH, env_up_address:str = None):
+async def train_rl_model_async(*args, **kwargs):
+    # model.learn is CPU-bound and synchronous: run it on a worker thread so an event loop keeps serving
+    return await asyncio.to_thread(train_rl_model, *args, **kwargs)
+
+def load_rl_model(load_path=MODEL_PATH):
+    # Repeated calls return the same in-memory model instead of re-reading the zip.
+    # Call load_rl_model.cache_clear() after (re)training to pick up the new file.
+    # The existence check stays outside the cache, so a model saved later is found on the next call.
     if not os.path.exists(load_path):
         print(f"No pre-trained model found at {load_path}. Consider training one first.")
-        # Fallback: create a new untrained model or return None
-        # For now, let's try to train a tiny one if not found
-        print("Attempting to train a new basic model...")
-        # This requires the SocialEnv to be usable synchronously for SB3
-        # The `train_rl_model` above uses a SimplifiedSocialEnv
-        # We need an env instance for DQN.load() if custom_objects or env is not saved with model
-        # Create a dummy env for loading, actual env for inference will be different
-        temp_env_for_loading = SimplifiedSocialEnv(up_address=DUMMY_UP_FOR_TRAINING) # Use the sync version
-        model = DQN('MlpPolicy', temp_env_for_loading, verbose=0)
-        # No actual training, just initializing a structure
-        print("Initialized a new, untrained model structure.")
-        return model
+        # No untrained placeholder: building a DQN allocates its optimizer and replay buffer for nothing.
+        # Callers handle None (main.py recommends random actions until a model is available).
+        return None
+    return _load_rl_model_cached(load_path)
 
+@functools.lru_cache(maxsize=8)
+def _load_rl_model_cached(load_path):
+    from stable_baselines3 import DQN
     print(f"Loading model from {load_path}")
     # When loading, you might need to pass the environment or custom objects
     # if they were not saved with the model or if you're using a custom policy.
@@ -153,15 +108,81 @@ def load_rl_model(load_path=MODEL_PATH, env_up_address:str = None):
     # For inference, we'll use the real SocialEnv (async). SB3 predict is sync.
     # This means the observation for `model.predict` must be obtained synchronously.
     # The FastAPI endpoint will get observation, then call predict.
-    # So, the env passed to `DQN.load` can be a placeholder if needed.
-    temp_env_for_loading = SimplifiedSocialEnv(up_address=env_up_address or DUMMY_UP_FOR_TRAINING)
-    model = DQN.load(load_path, env=temp_env_for_loading)
+    # No env is needed for that: the spaces are saved with the model, so skip building a placeholder env.
+    model = DQN.load(load_path, env=None)
     print("Model loaded successfully.")
     return model
 
+load_rl_model.cache_clear = _load_rl_model_cached.cache_clear
+
+class OnnxPolicy:
+    """Greedy policy served by ONNX Runtime, with the input bound once to a preallocated buffer."""
+
+    def __init__(self, onnx_model: bytes, obs_dim: int):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(onnx_model, providers=["CPUExecutionProvider"])
+        self._obs = np.zeros((1, obs_dim), dtype=np.float32)
+        self._binding = self.session.io_binding()
+        self._binding.bind_cpu_input("obs", self._obs) # Bound by reference: predict() just refills the buffer
+        self._binding.bind_output("q_values")
+
+    def predict(self, obs: np.ndarray) -> int:
+        self._obs[0] = obs
+        self.session.run_with_iobinding(self._binding)
+        return int(self._binding.copy_outputs_to_cpu()[0].argmax())
+
+class TorchPolicy:
+    """Greedy policy over a (possibly quantized) torch Q-network, skipping SB3's predict() preprocessing."""
+
+    def __init__(self, q_net, device):
+        self.q_net = q_net
+        self.device = device
+
+    def predict(self, obs: np.ndarray) -> int:
+        obs_t = torch.from_numpy(obs).unsqueeze(0).to(self.device, non_blocking=True)
+        with torch.inference_mode():
+            return int(self.q_net(obs_t).argmax(dim=1).item())
+
+def load_inference_policy(model):
+    """
+    Fast greedy inference for a DQN: its Q-network exported to ONNX and served with ONNX Runtime,
+    or, if export or onnxruntime is unavailable, the Q-network dynamically quantized to int8.
+    Equivalent to `model.predict(obs, deterministic=True)` up to quantization error.
+    """
+    q_net = model.policy.q_net.eval()
+    obs_dim = model.observation_space.shape[0]
+    try:
+        onnx_model = io.BytesIO()
+        torch.onnx.export(q_net, torch.zeros((1, obs_dim), dtype=torch.float32, device=model.device), onnx_model,
+                          opset_version=17, input_names=["obs"], output_names=["q_values"], dynamo=False)
+        return OnnxPolicy(onnx_model.getvalue(), obs_dim)
+    except Exception as e:
+        print(f"ONNX export unavailable ({e}), using dynamically quantized torch Q-network instead.")
+    # Quantized kernels are CPU-only; quantize a CPU copy so the SB3 model itself is left untouched
+    quantized = torch.quantization.quantize_dynamic(copy.deepcopy(q_net).cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+    return TorchPolicy(quantized, torch.device("cpu"))
+
+def scripted_policy_path(model_path=MODEL_PATH):
+    # The TorchScript Q-network is saved next to the SB3 zip, e.g. dqn_social_policy.pt
+    return os.path.splitext(model_path)[0] + ".pt"
+
+def export_torchscript(model, path):
+    """Saves `model`'s Q-network as a traced TorchScript CPU module, loadable without SB3 (see load_rl_model_fast)."""
+    q_net = copy.deepcopy(model.policy.q_net).cpu().eval()
+    obs_dim = model.observation_space.shape[0]
+    with torch.inference_mode():
+        scripted = torch.jit.trace(q_net, torch.zeros((1, obs_dim), dtype=torch.float32))
+    scripted.save(path)
+
+def load_rl_model_fast(load_path=None):
+    """
+    Greedy policy from the TorchScript Q-network saved at training time. Skips unzipping the
+    SB3 model and rebuilding the DQN, so it is much cheaper than load_rl_model + load_inference_policy.
+    """
+    scripted = torch.jit.load(load_path or scripted_policy_path(), map_location="cpu")
+    return TorchPolicy(scripted.eval(), torch.device("cpu"))
+
 # Example usage (run this file directly to train)
 if __name__ == "__main__":
-    import asyncio
     # To train, you would run: python -m backend.rl_agent.model
-    # Ensure SocialEnv can be instantiated and run by SB3 (i.e., it's effectively synchronous or wrapped)
-    asyncio.run(train_rl_model(total_timesteps=20000)) # Small number for quick test
\ No newline at end of file
+    train_rl_model(total_timesteps=20000, n_envs=min(os.cpu_count() or 1, 8)) # Small number for quick test
\ No newline at end of file
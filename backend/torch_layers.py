@@ -0,0 +1,16 @@
+# backend/rl_agent/torch_layers.py
+import gymnasium as gym
+import torch
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+
+class IdentityExtractor(BaseFeaturesExtractor):
+    """
+    Features extractor for flat observations that are already normalized to [0, 1]
+    (see SocialEnvSim): passes them straight to the Q-network MLP, skipping FlattenExtractor.
+    """
+
+    def __init__(self, observation_space: gym.spaces.Box):
+        super().__init__(observation_space, features_dim=observation_space.shape[0])
+
+    def forward(self, observations: torch.Tensor) -> torch.Tensor:
+        return observations
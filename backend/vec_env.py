@@ -0,0 +1,120 @@
+# backend/rl_agent/vec_env.py
+# Training-only: needs stable_baselines3, so it lives apart from the environments the API imports.
+import time
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from .environment import UNIFORMS_PER_STEP, ACTION_COST, REPETITION_PENALTY
+from .metrics import FOLLOWERS, POSTS_COUNT, ENGAGEMENT_RATE, MAX_FOLLOWERS, MAX_POSTS, MAX_ENGAGEMENT_RATE, INV_NORM
+
+class BatchedSocialEnv(VecEnv):
+    """
+    N simulated SocialEnvs stepped together, with metrics stored as one (N, 3) array so
+    normalization and reward are single NumPy ops across the batch. Same dynamics as SocialEnv.
+    Implements SB3's VecEnv directly, so it can be passed straight to `DQN(...)`. The per-env
+    observation space is unchanged, so `model.predict` still takes a single (3,) observation.
+    """
+
+    def __init__(self, num_envs: int, max_steps_per_episode: int = 100, seed=None,
+                 repetition_penalty: float = REPETITION_PENALTY):
+        observation_space = spaces.Box(low=0, high=1, shape=(3,), dtype=np.float32)
+        self.render_mode = None
+        super().__init__(num_envs, observation_space, spaces.Discrete(3))
+        self.max_followers = MAX_FOLLOWERS
+        self.max_posts = MAX_POSTS
+        self.max_engagement_rate = MAX_ENGAGEMENT_RATE
+        self.max_steps_per_episode = max_steps_per_episode
+        self.repetition_penalty = repetition_penalty
+
+        self._inv_scale = INV_NORM
+        self.metrics = np.empty((num_envs, 3), dtype=np.float32) # Same float32 layout as SocialEnvSim.simulated_metrics
+        # Last 3 actions per env for the repetition penalty; -1 means "no action yet"
+        self.action_history = np.full((num_envs, 3), -1, dtype=np.int8)
+        self.current_step = np.zeros(num_envs, dtype=np.int64)
+        self.episode_returns = np.zeros(num_envs, dtype=np.float64)
+        self._episode_start = np.full(num_envs, time.time())
+        self._rng = np.random.default_rng(seed)
+        self._actions = None
+
+    def _reset_envs(self, mask):
+        n = int(mask.sum())
+        self.metrics[mask, FOLLOWERS] = self._rng.integers(10, self.max_followers // 2, size=n, endpoint=True)
+        self.metrics[mask, POSTS_COUNT] = self._rng.integers(5, self.max_posts // 2, size=n, endpoint=True)
+        self.metrics[mask, ENGAGEMENT_RATE] = np.round(self._rng.uniform(0.01, self.max_engagement_rate / 2, size=n), 3)
+        self.action_history[mask] = -1
+        self.current_step[mask] = 0
+        self.episode_returns[mask] = 0.0
+        self._episode_start[mask] = time.time()
+
+    def _observations(self):
+        return np.clip(self.metrics * self._inv_scale, 0, 1)
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self._rng = np.random.default_rng(self._seeds[0])
+        self._reset_seeds()
+        self._reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self._observations()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        actions = self._actions
+        m = self.metrics
+        u = self._rng.random((self.num_envs, UNIFORMS_PER_STEP))
+        post, follow, reward_follower = actions == 0, actions == 1, actions == 2
+        engagement = m[:, ENGAGEMENT_RATE].copy() # Rewards depend on engagement before this step
+
+        rewards = np.full(self.num_envs, -ACTION_COST)
+        rewards += np.where(post, 0.1 + np.where(engagement > 0.05, 0.2 * u[:, 0], 0.0), 0.0)
+        rewards += np.where(follow, 0.05 + np.where(u[:, 1] < 0.2, 0.15 * u[:, 0], 0.0), 0.0)
+        rewards += np.where(reward_follower, np.where(engagement > 0.03, 0.1 + 0.2 * u[:, 0], -0.05), 0.0)
+        m[:, POSTS_COUNT] += post
+        m[:, FOLLOWERS] += follow & (u[:, 2] < 0.5)
+        m[:, ENGAGEMENT_RATE] *= np.where(reward_follower, 1.0 + 0.05 * u[:, 3], 1.0)
+
+        # Discourage spamming the same action
+        self.action_history[:, :-1] = self.action_history[:, 1:]
+        self.action_history[:, -1] = actions
+        h = self.action_history
+        rewards -= self.repetition_penalty * ((h[:, 0] >= 0) & (h[:, 0] == h[:, 1]) & (h[:, 1] == h[:, 2]))
+
+        # Organic growth/loss and engagement fluctuation
+        m[:, FOLLOWERS] = np.maximum(0.0, m[:, FOLLOWERS] + np.floor(4 * u[:, 4]) - 1)
+        m[:, ENGAGEMENT_RATE] = np.clip(m[:, ENGAGEMENT_RATE] * (0.98 + 0.04 * u[:, 5]), 0, self.max_engagement_rate)
+
+        self.current_step += 1
+        self.episode_returns += rewards
+        dones = self.current_step >= self.max_steps_per_episode
+        obs = self._observations()
+        infos = [{} for _ in range(self.num_envs)]
+        if dones.any():
+            now = time.time()
+            for i in np.flatnonzero(dones):
+                infos[i] = {
+                    "terminal_observation": obs[i].copy(),
+                    "TimeLimit.truncated": True, # Episodes only end on the step limit
+                    "episode": {"r": float(self.episode_returns[i]), "l": int(self.current_step[i]), "t": now - float(self._episode_start[i])},
+                }
+            self._reset_envs(dones)
+            obs[dones] = self._observations()[dones]
+        return obs, rewards.astype(np.float32), dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)] * len(self._get_indices(indices))
+
+    def set_attr(self, attr_name, value, indices=None):
+        # All envs share this object's attributes, so `indices` can't select a subset: the value applies to every env
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # Like get_attr: one shared object stands in for every sub-env, so call it once and repeat the result
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result] * len(self._get_indices(indices))
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * len(self._get_indices(indices))
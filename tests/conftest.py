@@ -0,0 +1,10 @@
+import os
+import sys
+
+# backend.blockchain builds its BlockchainService at import, which needs this config (a throwaway test key)
+os.environ.setdefault("TESTNET_RPC_URL", "http://127.0.0.1:1")
+os.environ.setdefault("AGENT_EOA_PRIVATE_KEY", "0x4c0883a69102937d6231471b5dbb6204fe5129617082792ae468d01a3f362318")
+os.environ.setdefault("AGENT_EOA_ADDRESS", "0x2c7536E3605D9C16a7a3D7b1898e529396a65c23")
+os.environ.setdefault("THANK_YOU_TOKEN_ADDRESS", "0x" + "11" * 20)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
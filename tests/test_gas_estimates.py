@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from backend.blockchain import BlockchainService, encode_lsp7_transfer
+
+AGENT = "0x2c7536E3605D9C16a7a3D7b1898e529396a65c23"
+UP = "0x" + "22" * 20
+
+
+def test_gas_estimates_are_cached_per_target_and_dropped_after_out_of_gas(monkeypatch):
+    async def run():
+        service = BlockchainService()
+        await service._nonces.seed(0)
+        service._fee_cache = (time.time(), 2, 1)
+        estimates = []
+
+        async def estimate_gas(tx):
+            estimates.append(tx["to"])
+            return 100
+
+        async def wait_for_transaction_receipt(tx_hash, poll_latency):
+            return {"status": 0, "gasUsed": 120}
+
+        monkeypatch.setattr(service.w3.eth, "estimate_gas", estimate_gas)
+        monkeypatch.setattr(service.w3.eth, "wait_for_transaction_receipt", wait_for_transaction_receipt)
+
+        set_data = {"to": UP, "data": "0x97902421" + "00" * 64}
+        for tx in (dict(set_data), dict(set_data), dict(set_data, to=AGENT)):
+            await service._preflight(tx)
+            assert tx["gas"] == 120
+        assert estimates == [UP, AGENT] # Same call on another contract gets its own estimate
+
+        # Recipient-dependent: estimated on every send
+        transfer = {"to": service.token_address, "data": encode_lsp7_transfer(AGENT, UP, 1)}
+        await service._preflight(dict(transfer))
+        await service._preflight(dict(transfer))
+        assert estimates[2:] == [service.token_address] * 2
+
+        # A revert that used the whole cached limit evicts it
+        await service._await_receipt("0x01", service._gas_key(set_data), 120)
+        await service._preflight(dict(set_data))
+        assert estimates[-1] == UP and len(estimates) == 5
+
+    asyncio.run(run())
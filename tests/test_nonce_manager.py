@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+from backend.blockchain import BlockchainService, NonceManager
+
+AGENT = "0x2c7536E3605D9C16a7a3D7b1898e529396a65c23"
+
+
+def test_local_released_nonces_are_reused_first():
+    async def run():
+        nonces = NonceManager(AGENT)
+        await nonces.seed(5)
+        assert [await nonces.next() for _ in range(3)] == [5, 6, 7] # All in flight
+        await nonces.release(7)
+        await nonces.release(6)
+        assert [await nonces.next() for _ in range(3)] == [6, 7, 8]
+
+    asyncio.run(run())
+
+
+def test_local_uncertain_nonces_are_settled_by_the_next_seed():
+    async def run():
+        nonces = NonceManager(AGENT)
+        await nonces.seed(5)
+        assert [await nonces.next() for _ in range(3)] == [5, 6, 7]
+        nonces.mark_uncertain(5) # Reached the node: the pending count moves past it
+        nonces.mark_uncertain(7) # Never reached the node
+        assert nonces.needs_seed
+        await nonces.seed(7)
+        assert not nonces.needs_seed
+        assert [await nonces.next() for _ in range(2)] == [7, 8]
+
+    asyncio.run(run())
+
+
+def test_redis_workers_share_counter_and_free_list():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def run():
+        server = fakeredis.FakeServer()
+        a, b = (NonceManager(AGENT, redis=fakeredis.FakeAsyncRedis(server=server)) for _ in range(2))
+        await a.seed(5)
+        await b.seed(5) # Boots later: keeps the shared counter
+        assert [await a.next(), await b.next(), await a.next()] == [5, 6, 7]
+        await b.release(6) # 7 is already out, so 6 goes to the free list instead of rolling back
+        assert await a.next() == 6
+        assert await b.next() == 8
+
+        await a.seed(12) # Txs were sent elsewhere: catch up, never move backwards
+        await b.seed(3)
+        assert await b.next() == 12
+
+    asyncio.run(run())
+
+
+def test_concurrent_sends_with_failures_leave_no_nonce_gap(monkeypatch):
+    async def run():
+        service = BlockchainService()
+        await service._nonces.seed(10)
+        sent = [] # Nonces the node accepted, in order
+
+        def pending_count():
+            nonce = 10
+            while nonce in sent:
+                nonce += 1
+            return nonce
+
+        async def preflight(tx):
+            tx["gas"] = 21000
+            if service._nonces.needs_seed:
+                await service._nonces.seed(pending_count())
+
+        async def sign(tx):
+            await asyncio.sleep(0) # Let the other sends take their nonces meanwhile
+            return SimpleNamespace(rawTransaction=(tx["nonce"], tx["data"]))
+
+        async def send_raw_transaction(raw):
+            nonce, data = raw
+            if data == "0xrejected":
+                raise ValueError("insufficient funds for gas * price + value")
+            if data == "0xlost":
+                raise aiohttp.ClientConnectionError("connection reset before the node got the tx")
+            sent.append(nonce)
+            if data == "0xtimeout":
+                raise asyncio.TimeoutError() # The node got it, but the response never arrived
+            return bytes([nonce]) * 32
+
+        async def fetch_pending_nonce():
+            raise AssertionError("only nonce errors may reset the counter")
+
+        async def await_receipt(tx_hash, gas_key, gas):
+            pass
+
+        monkeypatch.setattr(service, "_preflight", preflight)
+        monkeypatch.setattr(service, "_sign", sign)
+        monkeypatch.setattr(service, "_fetch_pending_nonce", fetch_pending_nonce)
+        monkeypatch.setattr(service, "_await_receipt", await_receipt)
+        monkeypatch.setattr(service.w3.eth, "send_raw_transaction", send_raw_transaction)
+        service._fee_cache = (0.0, 2, 1)
+
+        results = await asyncio.gather(
+            *(service._submit({"to": AGENT, "data": data}) for data in ("0xok", "0xrejected", "0xok")),
+            return_exceptions=True,
+        )
+        assert isinstance(results[1], ValueError)
+        assert sent == [10, 12]
+        await service._submit({"to": AGENT, "data": "0xok"}) # Refills the gap left by the rejected tx
+        assert sent == [10, 12, 11]
+
+        for data in ("0xlost", "0xtimeout"):
+            with pytest.raises((aiohttp.ClientError, asyncio.TimeoutError)):
+                await service._submit({"to": AGENT, "data": data})
+        # 13 was lost in transit, so the next send settles it against the pending count and reuses it
+        assert sent == [10, 12, 11, 13]
+        # The timed-out 13 did reach the node: the pending count has moved past it, so it isn't reused
+        await service._submit({"to": AGENT, "data": "0xok"})
+        assert sent == [10, 12, 11, 13, 14]
+
+    asyncio.run(run())